@@ -1,72 +1,212 @@
 """核心业务逻辑函数，负责读取配置和模板信息。"""
-from __future__ import annotations
-
+import os
 from pathlib import Path
+import pickle
 import re
-from typing import Dict, List
+from stat import S_IWGRP, S_IWOTH
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
 
 import yaml
 
+try:
+    # PyYAML 编译了 libyaml 时使用 C 实现的解析器，速度明显快于纯 Python 版本。
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # pragma: no cover - 取决于 PyYAML 的安装方式
+    from yaml import SafeLoader as _YamlLoader
+
+# 支持的生成方式：sync 逐个请求，async 并发请求，batch 走 OpenAI Batch API，
+# multiplex 将所有提示语合并为一次 Completions 请求。
+GENERATION_MODES = ("sync", "async", "batch", "multiplex")
+
+# 模板占位符的匹配规则，在模块加载时编译一次，避免每次解析模板重复编译。
+_PLACEHOLDER_RE = re.compile(r"\{([^{}]+)\}")
+
+# 已解析文件的进程内缓存，键为 (路径, 修改时间, 文件大小)，文件未变动时跳过重复解析。
+_CONFIG_CACHE: Dict[Tuple[str, int, int], Dict[str, object]] = {}
+_TEMPLATE_CACHE: Dict[Tuple[str, int, int], Dict[str, object]] = {}
+
+# load_config 返回字典的字段；字段集合变化的旧缓存会在读取时被字段校验拒绝。
+_CONFIG_KEYS = (
+    "model_name",
+    "temperature",
+    "mode",
+    "max_concurrency",
+    "stream",
+    "params",
+    "output_file",
+)
+# 磁盘缓存的结构版本。字段集合不变、仅修改字段取值或校验规则时，字段校验无法识别旧缓存，
+# 必须手动递增此版本号，否则按旧规则通过校验的配置会继续从缓存返回。
+_CONFIG_SCHEMA_VERSION = 2
+
+# pickle 反序列化可执行任意代码，因此只为项目目录下的配置启用磁盘缓存，
+# 并假定项目目录只有当前用户可写；POSIX 下另外校验缓存目录与文件的属主和权限。
+_PROJECT_ROOT = Path(__file__).resolve().parent
+
+
+def _config_pickle_path(config_path: Path, stat: os.stat_result) -> Optional[Path]:
+    """返回配置解析结果的磁盘缓存路径，文件名包含结构版本、修改时间与大小。
+
+    配置文件不在项目目录下时返回 None，表示不使用磁盘缓存。
+    """
+    if config_path.resolve().parent != _PROJECT_ROOT:
+        return None
+    filename = (
+        f"{config_path.stem}.v{_CONFIG_SCHEMA_VERSION}.{stat.st_mtime_ns}.{stat.st_size}.pkl"
+    )
+    return _PROJECT_ROOT / ".cache" / filename
+
+
+def _is_private(path: Path) -> bool:
+    """判断路径是否属于当前用户且不可被其他用户写入；不支持属主的平台直接视为可信。"""
+    if not hasattr(os, "getuid"):
+        return True
+    info = path.stat()
+    return info.st_uid == os.getuid() and not info.st_mode & (S_IWGRP | S_IWOTH)
+
+
+def _load_config_pickle(pickle_path: Optional[Path]) -> Optional[Dict[str, object]]:
+    """读取磁盘缓存的配置解析结果，缓存不存在、不可信、已损坏或字段不符时返回 None。"""
+    if pickle_path is None:
+        return None
+    try:
+        if not (_is_private(pickle_path.parent) and _is_private(pickle_path)):
+            return None
+        cached = pickle.loads(pickle_path.read_bytes())
+    except Exception:  # pylint: disable=broad-except
+        return None
+    if not isinstance(cached, dict) or set(cached) != set(_CONFIG_KEYS):
+        return None
+    return cached
+
+
+def _save_config_pickle(
+    config_path: Path, pickle_path: Optional[Path], result: Dict[str, object]
+) -> None:
+    """写入配置解析结果并清理同一配置文件的旧缓存，写入失败时静默跳过。"""
+    if pickle_path is None:
+        return
+    # 只匹配本配置文件生成的缓存名，避免误删 config.prod.yaml 等同前缀配置的缓存。
+    stale_re = re.compile(rf"{re.escape(config_path.stem)}\.(?:v\d+\.)?\d+\.\d+\.pkl")
+    tmp_name = None
+    try:
+        pickle_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # mkstemp 创建的文件仅当前用户可读写，写完后原子替换到目标位置。
+        fd, tmp_name = tempfile.mkstemp(dir=pickle_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, pickle_path)
+        tmp_name = None
+        for stale in pickle_path.parent.iterdir():
+            if stale != pickle_path and stale_re.fullmatch(stale.name):
+                stale.unlink(missing_ok=True)
+    except OSError:
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
 
-def load_config(config_path: Path) -> Dict[str, object]:
+
+def load_config(config_path: Path, report: Callable[[str], None] = print) -> Dict[str, object]:
     """读取配置文件并返回包含模型与参数信息的字典。
 
     参数:
         config_path: 配置文件的路径对象。
+        report: 输出错误提示的函数，默认直接打印；并发读取时可传入收集函数以便稍后按顺序输出。
 
     返回:
-        包含模型名称、温度、参数映射及输出文件路径的字典。
+        包含模型名称、温度、生成方式、并发上限、是否流式输出、参数映射及输出文件路径的字典。
+        文件未变动时返回缓存中的同一字典对象，调用方不应修改。
+
+    位于项目目录下的配置，其解析结果会以 pickle 形式保存在项目的 .cache 目录中，
+    配置未修改时后续运行直接读取该缓存，跳过 YAML 解析与字段校验。
     """
     try:
+        stat = config_path.stat()
+        cache_key = (str(config_path), stat.st_mtime_ns, stat.st_size)
+        cached = _CONFIG_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        pickle_path = _config_pickle_path(config_path, stat)
+        cached = _load_config_pickle(pickle_path)
+        if cached is not None:
+            _CONFIG_CACHE[cache_key] = cached
+            return cached
         with config_path.open("r", encoding="utf-8") as file:
-            data = yaml.safe_load(file) or {}
+            data = yaml.load(file, Loader=_YamlLoader) or {}
     except FileNotFoundError as exc:
-        print(f"读取配置文件失败，未找到文件: {exc}")
+        report(f"读取配置文件失败，未找到文件: {exc}")
         raise
     except yaml.YAMLError as exc:
-        print(f"解析配置文件失败，YAML 格式错误: {exc}")
+        report(f"解析配置文件失败，YAML 格式错误: {exc}")
         raise
     except Exception as exc:  # pylint: disable=broad-except
-        print(f"读取配置文件时发生未知错误: {exc}")
+        report(f"读取配置文件时发生未知错误: {exc}")
         raise
 
-    model_section = data.get("model", {}) if isinstance(data.get("model"), dict) else {}
+    model_section = data.get("model")
+    if not isinstance(model_section, dict):
+        model_section = {}
     model_name = data.get("openai_model") or model_section.get("name")
     temperature = data.get("temperature")
     if temperature is None:
         temperature = model_section.get("temperature")
 
+    mode = data.get("mode", "async")
+    if mode not in GENERATION_MODES:
+        report(f"配置文件中的 mode 字段应为 {' / '.join(GENERATION_MODES)} 之一。")
+        raise ValueError("mode 字段格式错误")
+
+    max_concurrency = data.get("max_concurrency", 10)
+    if isinstance(max_concurrency, bool) or not isinstance(max_concurrency, int) or max_concurrency < 1:
+        report("配置文件中的 max_concurrency 字段应为正整数。")
+        raise ValueError("max_concurrency 字段格式错误")
+
+    stream = data.get("stream", False)
+    if not isinstance(stream, bool):
+        report("配置文件中的 stream 字段应为 true 或 false。")
+        raise ValueError("stream 字段格式错误")
+
     params_data = data.get("params")
     if not isinstance(params_data, list):
-        print("配置文件中的 params 字段缺失或格式不正确，应为包含字典的列表。")
+        report("配置文件中的 params 字段缺失或格式不正确，应为包含字典的列表。")
         raise ValueError("params 字段格式错误")
 
-    params: Dict[str, str] = {}
-    for item in params_data:
-        if not isinstance(item, dict):
-            print("params 列表中的项目必须为字典，请检查配置文件。")
-            raise ValueError("params 项格式错误")
-        name = item.get("name")
-        prompt = item.get("prompt")
-        if not name or not prompt:
-            print("params 项缺少 name 或 prompt 字段，请补充完整。")
-            raise ValueError("params 信息缺失")
-        params[name] = prompt
+    if not all(isinstance(item, dict) for item in params_data):
+        report("params 列表中的项目必须为字典，请检查配置文件。")
+        raise ValueError("params 项格式错误")
+
+    # 先逐项检查再构建字典，避免同名项合并后掩盖前面缺失 prompt 的项。
+    if not all(item.get("name") and item.get("prompt") for item in params_data):
+        report("params 项缺少 name 或 prompt 字段，请补充完整。")
+        raise ValueError("params 信息缺失")
+
+    params: Dict[str, str] = {item["name"]: item["prompt"] for item in params_data}
 
     output_file = data.get("output_file")
     if not output_file:
-        output_section = data.get("output") if isinstance(data.get("output"), dict) else {}
+        output_section = data.get("output")
+        if not isinstance(output_section, dict):
+            output_section = {}
         directory = output_section.get("directory")
         filename = output_section.get("filename")
         if directory and filename:
             output_file = str(Path(directory) / filename)
 
-    return {
+    result: Dict[str, object] = {
         "model_name": model_name,
         "temperature": temperature,
+        "mode": mode,
+        "max_concurrency": max_concurrency,
+        "stream": stream,
         "params": params,
         "output_file": output_file,
     }
+    _CONFIG_CACHE[cache_key] = result
+    _save_config_pickle(config_path, pickle_path, result)
+    return result
 
 
 def load_template(template_path: Path) -> Dict[str, object]:
@@ -76,10 +216,25 @@ def load_template(template_path: Path) -> Dict[str, object]:
         template_path: 模板文件的路径对象。
 
     返回:
-        字典，包含模板内容与占位符名称列表。
+        字典，包含模板内容与占位符名称列表。文件未变动时返回缓存中的同一字典对象。
     """
     try:
-        template_text = template_path.read_text(encoding="utf-8")
+        stat = template_path.stat()
+        cache_key = (str(template_path), stat.st_mtime_ns, stat.st_size)
+        cached = _TEMPLATE_CACHE.get(cache_key)
+        if cached is not None:
+            return cached
+        # 按文件大小一次性读取全部字节再解码，省去文本包装层的额外缓冲。
+        # Windows 下需显式以二进制模式打开，避免 CRT 文本模式转换换行或将 \x1a 视为文件结尾。
+        fd = os.open(str(template_path), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            data = os.read(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        template_text = data.decode("utf-8")
+        if "\r" in template_text:
+            # 与 read_text 的通用换行模式保持一致，兼容 Windows 下保存的模板。
+            template_text = template_text.replace("\r\n", "\n").replace("\r", "\n")
     except FileNotFoundError as exc:
         print(f"读取模板文件失败，未找到文件: {exc}")
         raise
@@ -87,19 +242,12 @@ def load_template(template_path: Path) -> Dict[str, object]:
         print(f"读取模板文件时发生未知错误: {exc}")
         raise
 
-    placeholders: List[str] = []
-    try:
-        found = re.findall(r"{([^{}]+)}", template_text)
-        seen = set()
-        for name in found:
-            if name not in seen:
-                placeholders.append(name)
-                seen.add(name)
-    except re.error as exc:
-        print(f"解析模板占位符失败，正则表达式错误: {exc}")
-        raise
+    # dict 保持插入顺序，可在一次遍历中按首次出现顺序去重。
+    placeholders: List[str] = list(dict.fromkeys(_PLACEHOLDER_RE.findall(template_text)))
 
-    return {"content": template_text, "placeholders": placeholders}
+    result: Dict[str, object] = {"content": template_text, "placeholders": placeholders}
+    _TEMPLATE_CACHE[cache_key] = result
+    return result
 
 
 def validate_placeholders(template_placeholders: List[str], config_params: Dict[str, str]) -> None:
@@ -113,10 +261,8 @@ def validate_placeholders(template_placeholders: List[str], config_params: Dict[
         无返回值，如果存在不匹配情况则抛出异常。
     """
     template_set = set(template_placeholders)
-    config_set = set(config_params.keys())
-
-    missing_in_config = template_set - config_set
-    missing_in_template = config_set - template_set
+    missing_in_config = [name for name in template_placeholders if name not in config_params]
+    missing_in_template = [name for name in config_params if name not in template_set]
 
     if missing_in_config or missing_in_template:
         if missing_in_config:
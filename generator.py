@@ -1,37 +1,128 @@
 """与 OpenAI 模型交互的生成模块。"""
-from __future__ import annotations
-
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import logging
 import os
-from typing import Dict, List
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
 
 import openai
+from tqdm.asyncio import tqdm_asyncio
+from tqdm.contrib.logging import logging_redirect_tqdm
+
+try:
+    # 安装了 orjson 时使用其编解码批处理 JSONL，速度明显快于标准库 json。
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+_MAX_ATTEMPTS = 3
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+# 仅旧版 Completions 接口支持在一次请求中传入多个 prompt，chat.completions 不支持。
+_LIST_PROMPT_MODELS = ("gpt-3.5-turbo-instruct", "davinci-002", "babbage-002")
+# Completions 接口默认只返回 16 个 token，合并请求时需显式放宽。
+_COMPLETION_MAX_TOKENS = 256
+
+
+class DiskCache:
+    """以内容哈希为键的生成结果缓存，先查进程内字典，再查磁盘文件。
+
+    键由 salt、模型名称、温度与提示语共同计算得出；salt 通常取配置文件的
+    修改时间，配置变动后旧缓存自然失效。
+    """
+
+    def __init__(self, root: Path, salt: str = "") -> None:
+        self.root = root
+        self.salt = salt
+        self._memory: Dict[str, str] = {}
+
+    def key(self, model: str, temperature: float, prompt_text: str) -> str:
+        """计算单次请求对应的缓存键。"""
+        raw = f"{self.salt}|{model}|{temperature}|{prompt_text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存内容，未命中或缓存文件无法读取时返回 None。"""
+        if key in self._memory:
+            return self._memory[key]
+        try:
+            value = self._path(key).read_bytes().decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError) as exc:
+            logger.warning("⚠️ 读取缓存文件失败，按未命中处理: %s", exc)
+            return None
+        self._memory[key] = value
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存内容，同时更新进程内字典与磁盘文件；磁盘写入失败时仅保留内存中的结果。
+
+        先写入同目录下的临时文件再原子替换，中途被中断时不会留下截断的缓存文件。
+        """
+        self._memory[key] = value
+        path = self._path(key)
+        tmp_name = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(value.encode("utf-8"))
+            os.replace(tmp_name, path)
+        except OSError as exc:
+            logger.warning("⚠️ 写入缓存文件失败，本次结果仅保存在内存中: %s", exc)
+            if tmp_name is not None:
+                try:
+                    os.unlink(tmp_name)
+                except OSError:
+                    pass
 
 
-def _prepare_api_key() -> None:
-    """从环境变量读取 API Key 并配置 OpenAI SDK。"""
+@functools.cache
+def _api_key() -> str:
+    """从环境变量读取 API Key，首次读取成功后缓存结果。"""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise EnvironmentError("未找到 OPENAI_API_KEY 环境变量，无法调用 OpenAI 接口。")
-    openai.api_key = api_key
-
-
-def _extract_choices(response: object) -> List[Dict[str, object]]:
-    """从 OpenAI 响应对象中提取 choices 列表。"""
-    if hasattr(response, "choices"):
-        choices = getattr(response, "choices")
-        if isinstance(choices, list):
-            return choices
-    if isinstance(response, dict):
-        choices = response.get("choices")
-        if isinstance(choices, list):
-            return choices
-    try:
-        choices = response["choices"]  # type: ignore[index]
-        if isinstance(choices, list):
-            return choices
-    except Exception:  # pylint: disable=broad-except
-        pass
-    return []
+    return api_key
+
+
+@functools.cache
+def _client() -> openai.OpenAI:
+    """返回进程内共享的同步客户端，多次调用复用同一个 HTTP 连接池。"""
+    return openai.OpenAI(api_key=_api_key())
+
+
+def _json_dumps(value: object) -> bytes:
+    """将对象序列化为 UTF-8 编码的 JSON 字节串，非 ASCII 字符原样保留。"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> object:
+    """将 JSON 字节串解析为 Python 对象。"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def generate_param(prompt_text: str, model: str, temperature: float) -> str:
@@ -45,8 +136,6 @@ def generate_param(prompt_text: str, model: str, temperature: float) -> str:
     返回:
         模型返回的文本内容字符串。
     """
-    _prepare_api_key()
-
     if not prompt_text:
         raise ValueError("提示语不能为空")
 
@@ -57,48 +146,409 @@ def generate_param(prompt_text: str, model: str, temperature: float) -> str:
     if temperature is not None:
         request_params["temperature"] = temperature
 
+    client = _client()
     try:
-        response = openai.ChatCompletion.create(  # type: ignore[attr-defined]
-            **request_params,
-        )
+        response = client.chat.completions.create(**request_params)
     except Exception as exc:  # pylint: disable=broad-except
         raise RuntimeError(f"调用 OpenAI 接口失败: {exc}") from exc
 
-    choices = _extract_choices(response)
-    if not choices:
+    if not response.choices:
         raise RuntimeError("OpenAI 接口未返回任何结果")
 
-    message = choices[0].get("message") if isinstance(choices[0], dict) else None
-    if not message or not isinstance(message, dict) or "content" not in message:
+    content = response.choices[0].message.content
+    if content is None:
         raise RuntimeError("OpenAI 接口返回的数据格式不符合预期")
 
-    return str(message["content"]).strip()
+    return str(content).strip()
+
 
+async def _request_content(
+    client: openai.AsyncOpenAI, request_params: Dict[str, object], name: str, stream: bool
+) -> str:
+    """发送一次 ChatCompletion 请求并返回文本内容。
+
+    stream 为 True 时逐段接收模型输出并实时写到标准输出，首个 token 到达即可看到结果。
+    已输出部分内容后连接中断时抛出 RuntimeError，由调用方放弃重试。
+    """
+    if not stream:
+        response = await client.chat.completions.create(**request_params)
+        if not response.choices:
+            raise RuntimeError("OpenAI 接口未返回任何结果")
+        content = response.choices[0].message.content
+        if content is None:
+            raise RuntimeError("OpenAI 接口返回的数据格式不符合预期")
+        return content
 
-def generate_all(params: List[Dict[str, str]], model: str, temperature: float) -> Dict[str, str]:
-    """遍历配置中的参数提示语，依次调用模型生成所有字段内容。
+    buffer: List[str] = []
+    response = await client.chat.completions.create(**request_params, stream=True)
+    try:
+        async for event in response:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content
+            if delta:
+                if not buffer:
+                    # 首段内容到达时才输出前缀，尚未输出任何内容的失败仍可安全重试。
+                    sys.stdout.write(f"🎯 {name}：")
+                buffer.append(delta)
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+    except Exception as exc:  # pylint: disable=broad-except
+        if not buffer:
+            raise
+        # 部分内容已写到屏幕上，重试会造成重复输出，因此直接报错而不再重试。
+        sys.stdout.write("\n")
+        raise RuntimeError(f"{name} 流式输出中断，已输出部分内容，不再重试: {exc}") from exc
+    if not buffer:
+        raise RuntimeError("OpenAI 接口未返回任何结果")
+    sys.stdout.write("\n")
+    return "".join(buffer)
+
+
+async def _generate_param_async(
+    client: openai.AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    name: str,
+    prompt_text: str,
+    model: str,
+    temperature: float,
+    cache: Optional[DiskCache] = None,
+    stream: bool = False,
+) -> str:
+    """使用异步客户端调用 ChatCompletion 接口，生成单个参数内容。
+
+    并发数由 semaphore 限制；遇到限流、超时、连接错误或服务端 5xx 时
+    按指数退避重试，最多尝试 _MAX_ATTEMPTS 次。传入 cache 时命中则直接
+    返回缓存内容，不再发起请求。stream 为 True 时以流式方式实时输出内容。
+    """
+    cache_key = cache.key(model, temperature, prompt_text) if cache is not None else ""
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info("🎯 %s 命中缓存：%s", name, cached)
+            return cached
+
+    request_params: Dict[str, object] = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt_text}],
+    }
+    if temperature is not None:
+        request_params["temperature"] = temperature
+
+    async with semaphore:
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                content = await _request_content(client, request_params, name, stream)
+                break
+            except RuntimeError:
+                raise
+            except _RETRYABLE_ERRORS as exc:
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise RuntimeError(
+                        f"调用 OpenAI 接口失败，已重试 {_MAX_ATTEMPTS} 次: {exc}"
+                    ) from exc
+                await asyncio.sleep(2**attempt + random.random())
+            except Exception as exc:  # pylint: disable=broad-except
+                raise RuntimeError(f"调用 OpenAI 接口失败: {exc}") from exc
+
+    generated = str(content).strip()
+    if cache is not None:
+        cache.set(cache_key, generated)
+    if not stream:
+        logger.info("🎯 %s 生成完成：%s", name, generated)
+    return generated
+
+
+async def generate_all_async(
+    params: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_concurrency: int = 10,
+    cache: Optional[DiskCache] = None,
+    stream: bool = False,
+    show_progress: bool = True,
+) -> Dict[str, str]:
+    """并发调用模型生成所有字段内容，总耗时取决于最慢的一次请求。
 
     参数:
         params: 参数配置列表，每项包含 name 与 prompt 字段。
         model: 使用的模型名称，例如 "gpt-4"。
         temperature: 控制随机性的温度参数。
+        max_concurrency: 同时进行中的请求数上限，避免触发接口限流。
+        cache: 可选的结果缓存，命中的字段不会再调用接口。
+        stream: 是否以流式方式实时输出生成内容，建议与 max_concurrency=1 搭配使用，
+            否则多个字段的输出会交错。
+        show_progress: 是否显示进度条；流式输出时进度条会自动关闭。
+
+    返回:
+        由参数名称映射到生成内容的字典，顺序与 params 保持一致。
+    """
+    names: List[str] = []
+    prompts: List[str] = []
+    for item in params:
+        name = item.get("name")
+        prompt = item.get("prompt")
+        if not name or not prompt:
+            raise ValueError("参数配置缺少 name 或 prompt 字段")
+        names.append(name)
+        prompts.append(prompt)
+
+    # 异步客户端的连接池绑定当前事件循环，因此每次并发生成创建一个并在结束时关闭；
+    # 重试由 _generate_param_async 负责，关闭 SDK 自带重试以免叠加。
+    client = openai.AsyncOpenAI(api_key=_api_key(), max_retries=0)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    try:
+        tasks = [
+            _generate_param_async(
+                client, semaphore, name, prompt, model, temperature, cache, stream
+            )
+            for name, prompt in zip(names, prompts)
+        ]
+        # 日志经 tqdm.write 输出，避免逐项日志打断进度条的重绘。
+        with logging_redirect_tqdm():
+            results = await tqdm_asyncio.gather(
+                *tasks, desc="generating", disable=stream or not show_progress
+            )
+    finally:
+        await client.close()
+
+    return dict(zip(names, results))
+
+
+def generate_all(
+    params: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_concurrency: int = 10,
+    cache: Optional[DiskCache] = None,
+    stream: bool = False,
+    show_progress: bool = True,
+) -> Dict[str, str]:
+    """同步包装函数，内部以并发方式调用模型生成所有字段内容。
+
+    参数:
+        params: 参数配置列表，每项包含 name 与 prompt 字段。
+        model: 使用的模型名称，例如 "gpt-4"。
+        temperature: 控制随机性的温度参数。
+        max_concurrency: 同时进行中的请求数上限。
+        cache: 可选的结果缓存，命中的字段不会再调用接口。
+        stream: 是否以流式方式实时输出生成内容。
+        show_progress: 是否显示进度条。
 
     返回:
         由参数名称映射到生成内容的字典。
     """
-    results: Dict[str, str] = {}
+    return asyncio.run(
+        generate_all_async(
+            params, model, temperature, max_concurrency, cache, stream, show_progress
+        )
+    )
+
+
+def generate_all_batch(
+    params: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    poll_interval: float = 30,
+    cache: Optional[DiskCache] = None,
+) -> Dict[str, str]:
+    """通过 OpenAI Batch API 一次性提交所有字段的生成任务并等待结果。
+
+    适用于字段数量较多且不要求即时返回的场景：费用约为逐条调用的一半，
+    但任务最长可能需要 24 小时才能完成。传入 cache 时已缓存的字段不会提交，
+    成功的结果会立即写入缓存；部分字段失败时，成功的结果仍会保留在缓存中，
+    重新运行只需为失败字段付费。
+
+    参数:
+        params: 参数配置列表，每项包含 name 与 prompt 字段。
+        model: 使用的模型名称，例如 "gpt-4"。
+        temperature: 控制随机性的温度参数。
+        poll_interval: 轮询批处理任务状态的间隔秒数。
+        cache: 可选的结果缓存。
+
+    返回:
+        由参数名称映射到生成内容的字典，顺序与 params 保持一致。
+    """
+    names: List[str] = []
+    prompts: Dict[str, str] = {}
+    for item in params:
+        name = item.get("name")
+        prompt = item.get("prompt")
+        if not name or not prompt:
+            raise ValueError("参数配置缺少 name 或 prompt 字段")
+        names.append(name)
+        prompts[name] = prompt
+
+    generated: Dict[str, str] = {}
+    lines: List[bytes] = []
+    for name in names:
+        if cache is not None:
+            cached = cache.get(cache.key(model, temperature, prompts[name]))
+            if cached is not None:
+                logger.info("🎯 %s 命中缓存：%s", name, cached)
+                generated[name] = cached
+                continue
+        body: Dict[str, object] = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompts[name]}],
+        }
+        if temperature is not None:
+            body["temperature"] = temperature
+        lines.append(
+            _json_dumps(
+                {
+                    "custom_id": name,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+            )
+        )
+
+    if not lines:
+        return {name: generated[name] for name in names}
+
+    client = _client()
+    try:
+        batch_file = client.files.create(
+            file=("batch.jsonl", io.BytesIO(b"\n".join(lines))),
+            purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        logger.info("📦 已提交批处理任务 %s，共 %d 个字段，等待完成...", batch.id, len(lines))
+
+        while batch.status != "completed":
+            if batch.status in ("failed", "expired", "cancelling", "cancelled"):
+                raise RuntimeError(f"批处理任务 {batch.id} 未能完成，状态: {batch.status}")
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        # 全部请求失败时 output_file_id 为空，失败详情在 error_file_id 中，统一在下方汇总。
+        output_data = (
+            client.files.content(batch.output_file_id).content if batch.output_file_id else b""
+        )
+    except RuntimeError:
+        raise
+    except Exception as exc:  # pylint: disable=broad-except
+        raise RuntimeError(f"调用 OpenAI Batch 接口失败: {exc}") from exc
+
+    failures: Dict[str, str] = {}
+    for line in output_data.splitlines():
+        if not line.strip():
+            continue
+        record = _json_loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            failures[custom_id] = str(record.get("error") or response.get("body"))
+            continue
+        choices = (response.get("body") or {}).get("choices") or []
+        if not choices or choices[0].get("message", {}).get("content") is None:
+            failures[custom_id] = "OpenAI 接口未返回任何结果"
+            continue
+        content = str(choices[0]["message"]["content"]).strip()
+        generated[custom_id] = content
+        if cache is not None and custom_id in prompts:
+            cache.set(cache.key(model, temperature, prompts[custom_id]), content)
+
+    for name in names:
+        if name not in generated and name not in failures:
+            failures[name] = "批处理结果中缺少该字段"
+    if failures:
+        details = "; ".join(f"{name}: {reason}" for name, reason in failures.items())
+        kept = f"，成功的 {len(generated)} 个字段已写入缓存" if cache is not None else ""
+        raise RuntimeError(f"批处理任务中 {len(failures)} 个字段生成失败{kept}: {details}")
+
+    return {name: generated[name] for name in names}
+
+
+def _supports_list_prompt(model: str) -> bool:
+    """判断模型是否走旧版 Completions 接口，从而支持列表形式的 prompt。"""
+    return bool(model) and model.startswith(_LIST_PROMPT_MODELS)
+
+
+def generate_all_multiplexed(
+    params: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_concurrency: int = 10,
+    cache: Optional[DiskCache] = None,
+    stream: bool = False,
+    show_progress: bool = True,
+) -> Dict[str, str]:
+    """将所有字段的提示语合并为一次 Completions 请求，减少请求次数。
+
+    适用于受每分钟请求数（RPM）限制的场景。仅旧版 Completions 模型支持
+    列表形式的 prompt，其他模型会自动回退到并发调用 generate_all_async。
+
+    参数:
+        params: 参数配置列表，每项包含 name 与 prompt 字段。
+        model: 使用的模型名称，例如 "gpt-3.5-turbo-instruct"。
+        temperature: 控制随机性的温度参数。
+        max_concurrency: 回退到并发调用时的请求数上限。
+        cache: 回退到并发调用时使用的结果缓存。
+        stream: 回退到并发调用时是否以流式方式实时输出生成内容。
+        show_progress: 回退到并发调用时是否显示进度条。
+
+    返回:
+        由参数名称映射到生成内容的字典，顺序与 params 保持一致。
+    """
+    if not _supports_list_prompt(model):
+        logger.warning("⚠️ 模型 %s 不支持合并请求，改为并发逐个调用。", model)
+        return asyncio.run(
+            generate_all_async(
+                params, model, temperature, max_concurrency, cache, stream, show_progress
+            )
+        )
+
+    names: List[str] = []
+    prompts: List[str] = []
     for item in params:
         name = item.get("name")
         prompt = item.get("prompt")
         if not name or not prompt:
             raise ValueError("参数配置缺少 name 或 prompt 字段")
+        names.append(name)
+        prompts.append(prompt)
+
+    request_params: Dict[str, object] = {
+        "model": model,
+        "prompt": prompts,
+        "max_tokens": _COMPLETION_MAX_TOKENS,
+    }
+    if temperature is not None:
+        request_params["temperature"] = temperature
+
+    client = _client()
+    try:
+        response = client.completions.create(**request_params)
+    except Exception as exc:  # pylint: disable=broad-except
+        raise RuntimeError(f"调用 OpenAI 接口失败: {exc}") from exc
+
+    generated: Dict[int, str] = {}
+    for choice in response.choices:
+        if choice.finish_reason == "length":
+            raise RuntimeError(
+                f"{names[choice.index]} 的生成内容超过 {_COMPLETION_MAX_TOKENS} 个 token 被截断"
+            )
+        generated[choice.index] = str(choice.text).strip()
 
-        print(f"🎯 正在生成：{name} ...", end=" ")
-        generated = generate_param(prompt, model, temperature)
-        results[name] = generated
-        print(f"完成：{generated}")
+    missing = [name for index, name in enumerate(names) if index not in generated]
+    if missing:
+        raise RuntimeError(f"合并请求结果缺少以下字段: {', '.join(missing)}")
 
-    return results
+    return {name: generated[index] for index, name in enumerate(names)}
 
 
-__all__ = ["generate_param", "generate_all"]
+__all__ = [
+    "DiskCache",
+    "generate_param",
+    "generate_all",
+    "generate_all_async",
+    "generate_all_batch",
+    "generate_all_multiplexed",
+]
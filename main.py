@@ -1,31 +1,60 @@
 """PromptCrafter 主程序入口，负责初始化读取流程。"""
-from __future__ import annotations
-
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
 from pathlib import Path
 from typing import Dict, List
 
 from core import load_config, load_template, validate_placeholders
-from generator import generate_all
+from generator import (
+    DiskCache,
+    generate_all_async,
+    generate_all_batch,
+    generate_all_multiplexed,
+)
 
 
 def main() -> None:
     """启动程序，读取配置与模板并输出待生成的提示语信息。"""
+    parser = argparse.ArgumentParser(description="PromptCrafter Prompt 生成器")
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="不输出逐项生成日志与进度条"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="仅读取并校验模板与配置，不调用模型"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO, format="%(message)s"
+    )
+
     project_root = Path(__file__).resolve().parent
     config_path = project_root / "config.yaml"
     template_path = project_root / "prompts" / "template.txt"
 
-    try:
-        template_info = load_template(template_path)
-        placeholders = template_info["placeholders"]
-        print("🧩 模板读取成功，占位符如下：")
-        for name in placeholders:
-            print(f"  - {name}")
-    except Exception as exc:  # pylint: disable=broad-except
-        print(f"读取模板时发生错误，程序终止: {exc}")
-        return
+    # 模板与配置互不依赖，在线程池中同时读取以重叠两次磁盘 I/O。
+    # 配置读取的错误提示先收集起来，待模板信息输出后再打印，保持原有输出顺序。
+    config_messages: List[str] = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        template_future = executor.submit(load_template, template_path)
+        config_future = executor.submit(load_config, config_path, config_messages.append)
+
+        try:
+            template_info = template_future.result()
+            placeholders = template_info["placeholders"]
+            print("🧩 模板读取成功，占位符如下：")
+            for name in placeholders:
+                print(f"  - {name}")
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"读取模板时发生错误，程序终止: {exc}")
+            return
+
+    for message in config_messages:
+        print(message)
 
     try:
-        config = load_config(config_path)
+        config = config_future.result()
         validate_placeholders(placeholders, config["params"])
     except Exception as exc:  # pylint: disable=broad-except
         print(f"读取配置或校验占位符时发生错误，程序终止: {exc}")
@@ -42,6 +71,10 @@ def main() -> None:
     if output_file:
         print(f"\n📝 生成结果将保存至: {output_file}")
 
+    if args.dry_run:
+        print("\n✅ 准备完毕，已跳过模型调用（--dry-run）。")
+        return
+
     params_list: List[Dict[str, str]] = [
         {"name": name, "prompt": prompt} for name, prompt in config["params"].items()
     ]
@@ -49,12 +82,38 @@ def main() -> None:
     print(
         f"\n🔁 正在调用模型 {model_name} 为 {len(params_list)} 个字段生成内容："
     )
+    model_temperature = temperature if temperature is not None else 1.0
+    # 以配置文件修改时间作为缓存盐值，配置变动后旧结果自动失效。
+    cache = DiskCache(project_root / ".cache", salt=str(config_path.stat().st_mtime_ns))
     try:
-        generated_values = generate_all(
-            params_list,
-            model_name,
-            temperature if temperature is not None else 1.0,
-        )
+        if config["mode"] == "batch":
+            generated_values = generate_all_batch(
+                params_list, model_name, model_temperature, cache=cache
+            )
+        elif config["mode"] == "multiplex":
+            generated_values = generate_all_multiplexed(
+                params_list,
+                model_name,
+                model_temperature,
+                config["max_concurrency"],
+                cache,
+                config["stream"],
+                show_progress=not args.quiet,
+            )
+        else:
+            # sync 模式即并发上限为 1 的异步调用，逐个发送请求。
+            max_concurrency = 1 if config["mode"] == "sync" else config["max_concurrency"]
+            generated_values = asyncio.run(
+                generate_all_async(
+                    params_list,
+                    model_name,
+                    model_temperature,
+                    max_concurrency,
+                    cache,
+                    config["stream"],
+                    show_progress=not args.quiet,
+                )
+            )
     except Exception as exc:  # pylint: disable=broad-except
         print(f"调用模型生成内容时发生错误，程序终止: {exc}")
         return